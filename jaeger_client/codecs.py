@@ -31,6 +31,19 @@ from .constants import SAMPLED_FLAG, DEBUG_FLAG
 
 import urllib.parse
 
+_MAX_INT64 = 0xFFFFFFFFFFFFFFFF
+
+# trace_id_high, trace_id_low, span_id, parent_id, flags, baggage_count
+_BINARY_HEADER = struct.Struct('>QQQQBI')
+_LENGTH_PACK_INTO = struct.Struct('>I').pack_into
+_LENGTH_UNPACK = struct.Struct('>i').unpack_from
+
+# TextCodec header kinds, all but the last matched by exact name
+_TRACE_ID_HEADER = 0
+_DEBUG_ID_HEADER = 1
+_BAGGAGE_HEADER = 2
+_BAGGAGE_ITEM_HEADER = 3
+
 
 class Codec(object):
     def inject(self, span_context, carrier):
@@ -53,6 +66,15 @@ class TextCodec(Codec):
         self.debug_id_header = debug_id_header.lower().replace('_', '-')
         self.baggage_header = baggage_header
         self.prefix_length = len(baggage_header_prefix)
+        # Headers matched by exact name in extract(). Insertion order keeps the
+        # precedence of the original if/elif chain, and headers shadowed by the
+        # baggage prefix are left out so they are still treated as baggage.
+        self._exact_headers = {}
+        for header, field in ((self.baggage_header, _BAGGAGE_HEADER),
+                              (self.debug_id_header, _DEBUG_ID_HEADER)):
+            if not header.startswith(self.baggage_prefix):
+                self._exact_headers[header] = field
+        self._exact_headers[self.trace_id_header] = _TRACE_ID_HEADER
 
     def inject(self, span_context, carrier):
         if not isinstance(carrier, dict):
@@ -64,21 +86,20 @@ class TextCodec(Codec):
             parent_id=span_context.parent_id, flags=span_context.flags)
         baggage = span_context.baggage
         if baggage:
+            url_encoding = self.url_encoding
+            baggage_prefix = self.baggage_prefix
             for key, value in baggage.items():
-                encoded_key = key
-                if isinstance(key, (bytes,)):
-                    encoded_key = str(key, 'utf-8')
-                if self.url_encoding:
+                key_is_bytes = isinstance(key, bytes)
+                encoded_key = str(key, 'utf-8') if key_is_bytes else key
+                if url_encoding:
                     encoded_value = urllib.parse.quote(value)
+                elif key_is_bytes:
+                    encoded_value = str(value, 'utf-8')
                 else:
-                    if isinstance(key, (bytes,)):
-                        encoded_value = str(value, 'utf-8')
-                    else:
-                        encoded_value = value
+                    encoded_value = value
                 # Leave the below print(), you will thank me next time you debug unicode strings
                 # print('adding baggage', key, '=>', value, 'as', encoded_key, '=>', encoded_value)
-                header_key = '%s%s' % (self.baggage_prefix, encoded_key)
-                carrier[header_key] = encoded_value
+                carrier[baggage_prefix + encoded_key] = encoded_value
 
     def extract(self, carrier):
         if not hasattr(carrier, 'items'):
@@ -86,28 +107,32 @@ class TextCodec(Codec):
         trace_id, span_id, parent_id, flags = None, None, None, None
         baggage = None
         debug_id = None
+        # hoisted out of the loop, which runs once per header of every request
+        exact_header = self._exact_headers.get
+        baggage_prefix = self.baggage_prefix
+        prefix_length = self.prefix_length
+        url_encoding = self.url_encoding
         for key, value in carrier.items():
             uc_key = key.lower()
-            if uc_key == self.trace_id_header:
-                if self.url_encoding:
-                    value = urllib.parse.unquote(value)
-                trace_id, span_id, parent_id, flags = \
-                    span_context_from_string(value)
-            elif uc_key.startswith(self.baggage_prefix):
-                if self.url_encoding:
-                    value = urllib.parse.unquote(value)
-                attr_key = key[self.prefix_length:]
+            field = exact_header(uc_key)
+            if field is None:
+                if not uc_key.startswith(baggage_prefix):
+                    continue
+                field = _BAGGAGE_ITEM_HEADER
+            if url_encoding:
+                value = urllib.parse.unquote(value)
+            if field == _BAGGAGE_ITEM_HEADER:
+                attr_key = uc_key[prefix_length:]
                 if baggage is None:
-                    baggage = {attr_key.lower(): value}
+                    baggage = {attr_key: value}
                 else:
-                    baggage[attr_key.lower()] = value
-            elif uc_key == self.debug_id_header:
-                if self.url_encoding:
-                    value = urllib.parse.unquote(value)
+                    baggage[attr_key] = value
+            elif field == _TRACE_ID_HEADER:
+                trace_id, span_id, parent_id, flags = \
+                    span_context_from_string(value)
+            elif field == _DEBUG_ID_HEADER:
                 debug_id = value
-            elif uc_key == self.baggage_header:
-                if self.url_encoding:
-                    value = urllib.parse.unquote(value)
+            else:
                 baggage = self._parse_baggage_header(value, baggage)
         if not trace_id or not span_id:
             # reset all IDs
@@ -139,26 +164,47 @@ class BinaryCodec(Codec):
         if not isinstance(carrier, bytearray):
             raise InvalidCarrierException('carrier not a bytearray')
         # check if we have 128 bit trace_id, break it into two 64 units
-        max_int64 = 0xFFFFFFFFFFFFFFFF
-        if span_context.trace_id > max_int64:
-            high = (span_context.trace_id >> 64) & max_int64
-            low = span_context.trace_id & max_int64
+        trace_id = span_context.trace_id
+        if trace_id > _MAX_INT64:
+            high = (trace_id >> 64) & _MAX_INT64
+            low = trace_id & _MAX_INT64
         else:
             high = 0
-            low = span_context.trace_id
-        carrier += struct.pack('>QQQQBI', high, low, span_context.span_id or 0,
-                               span_context.parent_id or 0, span_context.flags,
-                               len(span_context.baggage))
-
-        for k, v in span_context.baggage.items():
-            carrier += self._pack_baggage_item(k, v)
+            low = trace_id
+        # encode baggage up front so the carrier can be grown exactly once
+        baggage = []
+        size = _BINARY_HEADER.size
+        for key, value in span_context.baggage.items():
+            if not isinstance(key, bytes):
+                key = key.encode('utf-8')
+            if not isinstance(value, bytes):
+                value = value.encode('utf-8')
+            baggage.append((key, value))
+            size += 8 + len(key) + len(value)
+
+        offset = len(carrier)
+        carrier += bytes(size)
+        _BINARY_HEADER.pack_into(carrier, offset, high, low, span_context.span_id or 0,
+                                 span_context.parent_id or 0, span_context.flags,
+                                 len(baggage))
+        offset += _BINARY_HEADER.size
+
+        for key, value in baggage:
+            _LENGTH_PACK_INTO(carrier, offset, len(key))
+            offset += 4
+            carrier[offset:offset + len(key)] = key
+            offset += len(key)
+            _LENGTH_PACK_INTO(carrier, offset, len(value))
+            offset += 4
+            carrier[offset:offset + len(value)] = value
+            offset += len(value)
 
     def extract(self, carrier):
         if not isinstance(carrier, bytearray):
             raise InvalidCarrierException('carrier not a bytearray')
-        baggage = {}
+        baggage = None
         high_trace_id, low_trace_id, span_id, parent_id, flags, baggage_count = \
-            struct.unpack('>QQQQBI', carrier[:37])
+            _BINARY_HEADER.unpack_from(carrier, 0)
         # if high_trace_id isn't 0, then we are dealing with 128bit trace id integer,
         # therefore unpack into 1 number
         if high_trace_id:
@@ -167,41 +213,32 @@ class BinaryCodec(Codec):
             trace_id = low_trace_id
 
         if baggage_count != 0:
-            baggage_data = carrier[37:]
-            for _ in range(baggage_count):
-                key, value, bytes_read = self._unpack_baggage_item(baggage_data)
-                baggage[key] = value
-                baggage_data = baggage_data[bytes_read:]
+            baggage = {}
+            offset = _BINARY_HEADER.size
+            # read baggage through a view so strings are decoded without copying
+            # them out of the carrier first; released so the carrier can resize
+            with memoryview(carrier) as data:
+                for _ in range(baggage_count):
+                    key, value, bytes_read = self._unpack_baggage_item(data, offset)
+                    baggage[key] = value
+                    offset += bytes_read
 
         return SpanContext(trace_id=trace_id, span_id=span_id,
                            parent_id=parent_id, flags=flags, baggage=baggage)
 
-    def _pack_baggage_item(self, key, value):
-        baggage = bytearray()
-        if not isinstance(key, bytes):
-            key = key.encode('utf-8')
-        baggage += struct.pack('>I', len(key))
-        baggage += key
-
-        if not isinstance(value, bytes):
-            value = value.encode('utf-8')
-        baggage += struct.pack('>I', len(value))
-        baggage += value
-        return baggage
-
-    def _unpack_baggage_item(self, baggage):
-        bytes_read = 0
-        key, b_read = self._read_kv(baggage)
-        bytes_read += b_read
-        value, b_read = self._read_kv(baggage[bytes_read:])
-        bytes_read += b_read
-        return key, value, bytes_read
+    def _unpack_baggage_item(self, baggage, offset):
+        key, key_read = self._read_kv(baggage, offset)
+        value, value_read = self._read_kv(baggage, offset + key_read)
+        return key, value, key_read + value_read
 
-    def _read_kv(self, data):
-        data_len = struct.unpack('>i', data[:4])[0]
-        data_value = struct.unpack('>' + 'c' * data_len, data[4:4 + data_len])
-        bytes_read = 4 + data_len
-        return b''.join(data_value).decode('utf-8'), bytes_read
+    def _read_kv(self, data, offset):
+        data_len = _LENGTH_UNPACK(data, offset)[0]
+        start = offset + 4
+        end = start + data_len
+        # a slice would silently return a short value from a truncated carrier
+        if data_len < 0 or end > len(data):
+            raise struct.error('unpack requires a buffer of %d bytes' % data_len)
+        return str(data[start:end], 'utf-8'), 4 + data_len
 
 
 def span_context_to_string(trace_id, span_id, parent_id, flags):
@@ -218,7 +255,7 @@ def span_context_to_string(trace_id, span_id, parent_id, flags):
     :param flags:
     """
     parent_id = parent_id or 0
-    return '{:x}:{:x}:{:x}:{:x}'.format(trace_id, span_id, parent_id, flags)
+    return '%x:%x:%x:%x' % (trace_id, span_id, parent_id, flags)
 
 
 def span_context_from_string(value):
@@ -241,20 +278,21 @@ def span_context_from_string(value):
     if len(parts) != 4:
         raise SpanContextCorruptedException(
             'malformed trace context "%s"' % value)
+    trace_id, span_id, parent_id, flags = parts
     try:
-        trace_id = int(parts[0], 16)
-        span_id = int(parts[1], 16)
-        parent_id = int(parts[2], 16)
-        flags = int(parts[3], 16)
-        if trace_id < 1 or span_id < 1 or parent_id < 0 or flags < 0:
-            raise SpanContextCorruptedException(
-                'malformed trace context "%s"' % value)
-        if parent_id == 0:
-            parent_id = None
-        return trace_id, span_id, parent_id, flags
+        trace_id = int(trace_id, 16)
+        span_id = int(span_id, 16)
+        parent_id = int(parent_id, 16)
+        flags = int(flags, 16)
     except ValueError as e:
         raise SpanContextCorruptedException(
             'malformed trace context "%s": %s' % (value, e))
+    if trace_id < 1 or span_id < 1 or parent_id < 0 or flags < 0:
+        raise SpanContextCorruptedException(
+            'malformed trace context "%s"' % value)
+    if parent_id == 0:
+        parent_id = None
+    return trace_id, span_id, parent_id, flags
 
 
 # String constants identifying the interop format.
@@ -305,6 +343,14 @@ class ZipkinCodec(Codec):
                            baggage=None)
 
 
+# B3Codec header kinds
+_B3_TRACE_ID_HEADER = 0
+_B3_SPAN_ID_HEADER = 1
+_B3_PARENT_SPAN_ID_HEADER = 2
+_B3_SAMPLED_HEADER = 3
+_B3_FLAGS_HEADER = 4
+
+
 def header_to_hex(header):
     if not isinstance(header, (str,)):
         raise SpanContextCorruptedException(
@@ -333,6 +379,13 @@ class B3Codec(Codec):
     _sampled_header_lc = sampled_header.lower()
     flags_header = 'X-B3-Flags'
     _flags_header_lc = flags_header.lower()
+    _header_kinds = {
+        _trace_header_lc: _B3_TRACE_ID_HEADER,
+        _span_header_lc: _B3_SPAN_ID_HEADER,
+        _parent_span_header_lc: _B3_PARENT_SPAN_ID_HEADER,
+        _sampled_header_lc: _B3_SAMPLED_HEADER,
+        _flags_header_lc: _B3_FLAGS_HEADER,
+    }
 
     def __init__(self, generate_128bit_trace_id=False):
         self.generate_128bit_trace_id = generate_128bit_trace_id
@@ -341,15 +394,17 @@ class B3Codec(Codec):
         if not isinstance(carrier, dict):
             raise InvalidCarrierException('carrier not a dictionary')
         if self.generate_128bit_trace_id:
-            carrier[self.trace_header] = format(span_context.trace_id, 'x').zfill(32)
+            carrier[self.trace_header] = format(span_context.trace_id, '032x')
         else:
-            carrier[self.trace_header] = format(span_context.trace_id, 'x').zfill(16)
-        carrier[self.span_header] = format(span_context.span_id, 'x').zfill(16)
+            carrier[self.trace_header] = format(span_context.trace_id, '016x')
+        carrier[self.span_header] = format(span_context.span_id, '016x')
         if span_context.parent_id is not None:
-            carrier[self.parent_span_header] = format(span_context.parent_id, 'x').zfill(16)
-        if span_context.flags & DEBUG_FLAG == DEBUG_FLAG:
+            carrier[self.parent_span_header] = format(span_context.parent_id, '016x')
+        # both flags are single bits, so a non-zero mask means the flag is set
+        flags = span_context.flags
+        if flags & DEBUG_FLAG:
             carrier[self.flags_header] = '1'
-        elif span_context.flags & SAMPLED_FLAG == SAMPLED_FLAG:
+        elif flags & SAMPLED_FLAG:
             carrier[self.sampled_header] = '1'
 
     def extract(self, carrier):
@@ -357,19 +412,22 @@ class B3Codec(Codec):
             raise InvalidCarrierException('carrier not a dictionary')
         trace_id = span_id = parent_id = None
         flags = 0x00
+        header_kind = self._header_kinds.get
         for header_key, header_value in carrier.items():
             if header_value is None:
                 continue
-            lower_key = header_key.lower()
-            if lower_key == self._trace_header_lc:
+            kind = header_kind(header_key.lower())
+            if kind is None:
+                continue
+            if kind == _B3_TRACE_ID_HEADER:
                 trace_id = header_to_hex(header_value)
-            elif lower_key == self._span_header_lc:
+            elif kind == _B3_SPAN_ID_HEADER:
                 span_id = header_to_hex(header_value)
-            elif lower_key == self._parent_span_header_lc:
+            elif kind == _B3_PARENT_SPAN_ID_HEADER:
                 parent_id = header_to_hex(header_value)
-            elif lower_key == self._sampled_header_lc and header_value == '1':
+            elif kind == _B3_SAMPLED_HEADER and header_value == '1':
                 flags |= SAMPLED_FLAG
-            elif lower_key == self._flags_header_lc and header_value == '1':
+            elif kind == _B3_FLAGS_HEADER and header_value == '1':
                 flags |= DEBUG_FLAG
         if not trace_id or not span_id:
             return None
@@ -14,6 +14,7 @@
 
 from __future__ import absolute_import
 
+import struct
 import unittest
 from collections import namedtuple
 from itertools import product
@@ -210,6 +211,14 @@ class TestCodecs(unittest.TestCase):
                 'hermes': 'LaBarbara Hermes',
             }
 
+    def test_context_from_headers_with_baggage_prefix(self):
+        # a debug header that starts with the baggage prefix is read as baggage
+        codec = TextCodec(baggage_header_prefix='x-',
+                          debug_id_header='X-Debug-ID')
+        ctx = codec.extract({'x-debug-id': 'Coraline'})
+        assert ctx.debug_id is None
+        assert ctx.baggage == {'debug-id': 'Coraline'}
+
     def test_context_from_large_ids(self):
         codec = TextCodec(trace_id_header='Trace_ID',
                           baggage_header_prefix='Trace-Attr-')
@@ -419,6 +428,46 @@ class TestCodecs(unittest.TestCase):
         assert extracted_span_context.flags == span_context.flags
         assert extracted_span_context.baggage == span_context.baggage
 
+    def test_binary_codec_multiple_baggage_items(self):
+        codec = BinaryCodec()
+        baggage = {b'bytes-key': b'bytes-value',
+                   'caf\u00e9': '\u00fcber \U0001F47E',
+                   'empty': '',
+                   '\u65e5\u672c': b'\xe8\xaa\x9e'}
+        span_context = SpanContext(trace_id=1, span_id=2, parent_id=None, flags=1,
+                                   baggage=baggage)
+
+        carrier = bytearray()
+        codec.inject(span_context, carrier)
+        extracted_span_context = codec.extract(carrier)
+        assert extracted_span_context.baggage == {
+            'bytes-key': 'bytes-value',
+            'caf\u00e9': '\u00fcber \U0001F47E',
+            'empty': '',
+            '\u65e5\u672c': '\u8a9e',
+        }
+
+    def test_binary_codec_truncated_carrier(self):
+        codec = BinaryCodec()
+        span_context = SpanContext(trace_id=1, span_id=2, parent_id=None, flags=1,
+                                   baggage={'key': 'value'})
+        carrier = bytearray()
+        codec.inject(span_context, carrier)
+        # 37 byte header, then 4 + len('key') and 4 + len('value')
+        assert len(carrier) == 37 + 7 + 9
+
+        cuts = {
+            20: 'inside header',
+            39: 'inside key length',
+            42: 'inside key',
+            46: 'inside value length',
+            50: 'inside value',
+            len(carrier) - 1: 'last byte of value',
+        }
+        for cut, where in cuts.items():
+            with self.assertRaises(struct.error, msg=where):
+                codec.extract(carrier[:cut])
+
     def test_binary_codec_extract_compatibility_with_golang_client(self):
         tracer = Tracer(
             service_name='test',
@@ -520,6 +569,17 @@ def test_ad_hoc_baggage_without_trace_id(tracer):
     )
 
 
+def test_ad_hoc_baggage_header_skips_malformed_items():
+    codec = TextCodec()
+    ctx = codec.extract({
+        'jaeger-baggage': 'kiff=Amy,, hermes, bender=Bender=Rodriguez, fry=Philip ',
+    })
+    assert ctx.baggage == {
+        'kiff': 'Amy',
+        'fry': 'Philip',
+    }
+
+
 def _test_baggage_without_trace_id(tracer, trace_id_header, baggage_header_prefix, headers, match):
     codec = TextCodec(
         trace_id_header=trace_id_header,
@@ -0,0 +1,62 @@
+# Copyright (c) 2016 Uber Technologies, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from jaeger_client.codecs import BinaryCodec, TextCodec
+from jaeger_client.span_context import SpanContext
+
+
+def _span_context(baggage_items=5):
+    baggage = {'key-%d' % i: 'value-%d' % i for i in range(baggage_items)}
+    return SpanContext(trace_id=260817200211625699950706086749966912306,
+                       span_id=567890, parent_id=1234567890, flags=1,
+                       baggage=baggage)
+
+
+def _inject(codec, span_context, new_carrier, iterations=1000):
+    for i in range(0, iterations):
+        codec.inject(span_context, new_carrier())
+
+
+def _extract(codec, carrier, iterations=1000):
+    for i in range(0, iterations):
+        codec.extract(carrier)
+
+
+def test_binary_codec_inject(benchmark):
+    benchmark(_inject, BinaryCodec(), _span_context(), bytearray)
+
+
+def test_binary_codec_extract(benchmark):
+    codec = BinaryCodec()
+    carrier = bytearray()
+    codec.inject(_span_context(), carrier)
+    benchmark(_extract, codec, carrier)
+
+
+def test_text_codec_inject(benchmark):
+    benchmark(_inject, TextCodec(), _span_context(), dict)
+
+
+def test_text_codec_extract(benchmark):
+    codec = TextCodec()
+    carrier = {'Content-Type': 'application/json', 'User-Agent': 'benchmark'}
+    codec.inject(_span_context(), carrier)
+    benchmark(_extract, codec, carrier)
+
+
+def test_binary_codec_extract_large_baggage(benchmark):
+    codec = BinaryCodec()
+    carrier = bytearray()
+    codec.inject(_span_context(baggage_items=100), carrier)
+    benchmark(_extract, codec, carrier, iterations=100)